@@ -1,7 +1,6 @@
 from flask import Flask, request, jsonify, Response, session, redirect, url_for
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
-import sqlite3
 import uuid
 from datetime import datetime
 import os
@@ -16,6 +15,8 @@ load_dotenv()
 # Add services to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'services'))
 # from gaze_tracker import GazeTracker
+from services.storage import (DEFAULT_TENANT, InvalidTenantError, ShardRouter,
+                              UnknownTenantError, merge_stats, shard_stats)
 
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', secrets.token_hex(32))
@@ -27,7 +28,7 @@ app.config['SESSION_COOKIE_HTTPONLY'] = True
 CORS(app,
      supports_credentials=True,
      origins=["http://localhost:3000", "http://127.0.0.1:3000"],
-     allow_headers=["Content-Type"],
+     allow_headers=["Content-Type", "X-Tenant-ID"],
      expose_headers=["Set-Cookie"])
 socketio = SocketIO(app, cors_allowed_origins="*")
 
@@ -38,90 +39,73 @@ SPOTIFY_CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET')
 SPOTIFY_REDIRECT_URI = os.getenv('SPOTIFY_REDIRECT_URI', 'http://localhost:5000/api/spotify/callback')
 FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:3000')
 
-DATABASE = 'pomodoro.db'
+DATABASE = os.getenv('DATABASE', 'pomodoro.db')
+SHARD_DIR = os.getenv('SHARD_DIR', 'shards')
+MAX_OPEN_SHARDS = int(os.getenv('MAX_OPEN_SHARDS', '32'))
+
+# Each tenant gets its own SQLite file; the default tenant keeps using DATABASE
+storage = ShardRouter(DATABASE, SHARD_DIR, max_open=MAX_OPEN_SHARDS)
 
 # Global tracker instance
 active_sessions = {}
 
 
+def current_tenant():
+    """Get the tenant key for the current request"""
+    return request.headers.get('X-Tenant-ID', DEFAULT_TENANT)
+
+
 def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get database connection for writing to the tenant's shard"""
+    return storage.connect(current_tenant())
+
+
+def read_db():
+    """Get a read-only connection to the tenant's shard"""
+    return storage.snapshot(current_tenant())
 
 
 def init_db():
     """Initialize database tables"""
-    conn = get_db()
-    cursor = conn.cursor()
-
-    # Sessions table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sessions (
-            id TEXT PRIMARY KEY,
-            start_time TIMESTAMP,
-            end_time TIMESTAMP,
-            duration INTEGER,
-            eye_activity_score REAL DEFAULT 0
-        )
-    ''')
-
-    # Eye activity logs table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS eye_activity (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id TEXT,
-            timestamp TIMESTAMP,
-            gaze_focused BOOLEAN,
-            FOREIGN KEY (session_id) REFERENCES sessions (id)
-        )
-    ''')
+    # Shards create their tables when first opened
+    with storage.connect(DEFAULT_TENANT):
+        pass
 
-    conn.commit()
-    conn.close()
 
-@app.route('/api/stats', methods=['GET'])
-def get_stats():
-    """Get user statistics"""
-    conn = get_db()
-    cursor = conn.cursor()
+@app.errorhandler(InvalidTenantError)
+def handle_invalid_tenant(error):
+    return jsonify({'error': str(error)}), 400
 
-    # Total sessions
-    cursor.execute("SELECT COUNT(*) as total_sessions FROM sessions")
-    total_sessions = cursor.fetchone()['total_sessions']
 
-    # Total focus time
-    cursor.execute("SELECT SUM(duration) as total_focus_time FROM sessions")
-    total_focus_time = cursor.fetchone()['total_focus_time'] or 0
+@app.errorhandler(UnknownTenantError)
+def handle_unknown_tenant(error):
+    return jsonify({'error': str(error)}), 404
 
-    # Average session length
-    cursor.execute("SELECT AVG(duration) as avg_session FROM sessions")
-    avg_session = cursor.fetchone()['avg_session'] or 0
 
-    # Today’s sessions
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Get user statistics"""
     today = datetime.now().date()
-    cursor.execute("SELECT COUNT(*) as today_sessions FROM sessions WHERE DATE(start_time) = ?", (today,))
-    today_sessions = cursor.fetchone()['today_sessions']
+    try:
+        with read_db() as conn:
+            partials = [shard_stats(conn, today)]
+    except UnknownTenantError:
+        # Tenant has not logged anything yet
+        partials = []
 
-    # average focus score per session
-    cursor.execute("SELECT AVG(eye_activity_score) as avg_focus_time FROM sessions")
-    avg_focus_score = cursor.fetchone()['avg_focus_time'] or 0
+    return jsonify(merge_stats(partials))
 
-    # best focus score
-    cursor.execute("SELECT MAX(eye_activity_score) as best_focus_score FROM sessions")
-    best_focus_score = cursor.fetchone()['best_focus_score'] or 0
 
-    conn.close()
+@app.route('/api/stats/global', methods=['GET'])
+def get_global_stats():
+    """Get statistics aggregated across every tenant shard"""
+    today = datetime.now().date()
+    partials = storage.collect(lambda conn: shard_stats(conn, today))
+
+    stats = merge_stats(partials)
+    stats['tenants'] = len(partials)
+    return jsonify(stats)
 
-    return jsonify({
-        'totalSessions': total_sessions,
-        'totalFocusTime': total_focus_time,
-        'averageSession': round(avg_session / 60, 2),   # minutes
-        'todaySessions': today_sessions,
-        'averageFocusScore': round(avg_focus_score * 100, 2),  # percentage
-        'bestFocusScore': round(best_focus_score * 100, 2)  # percentage
-    })
 
 @app.route('/api/start_session', methods=['POST'])
 def start_session():
@@ -129,14 +113,13 @@ def start_session():
     session_id = str(uuid.uuid4())
     start_time = datetime.now()
 
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        'INSERT INTO sessions (id, start_time) VALUES (?, ?)',
-        (session_id, start_time)
-    )
-    conn.commit()
-    conn.close()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT INTO sessions (id, start_time) VALUES (?, ?)',
+            (session_id, start_time)
+        )
+        conn.commit()
 
     return jsonify({
         'session_id': session_id,
@@ -188,38 +171,36 @@ def end_session():
 
     end_time = datetime.now()
 
-    conn = get_db()
-    cursor = conn.cursor()
+    with get_db() as conn:
+        cursor = conn.cursor()
 
-    # Get session start time
-    cursor.execute('SELECT start_time FROM sessions WHERE id = ?', (session_id,))
-    row = cursor.fetchone()
+        # Get session start time
+        cursor.execute('SELECT start_time FROM sessions WHERE id = ?', (session_id,))
+        row = cursor.fetchone()
 
-    if not row:
-        conn.close()
-        return jsonify({'error': 'Session not found'}), 404
+        if not row:
+            return jsonify({'error': 'Session not found'}), 404
 
-    start_time = datetime.fromisoformat(row['start_time'])
-    duration = int((end_time - start_time).total_seconds())
+        start_time = datetime.fromisoformat(row['start_time'])
+        duration = int((end_time - start_time).total_seconds())
 
-    # Calculate eye activity score
-    cursor.execute(
-        'SELECT COUNT(*) as total, SUM(CASE WHEN gaze_focused THEN 1 ELSE 0 END) as focused FROM eye_activity WHERE session_id = ?',
-        (session_id,)
-    )
-    activity_row = cursor.fetchone()
+        # Calculate eye activity score
+        cursor.execute(
+            'SELECT COUNT(*) as total, SUM(CASE WHEN gaze_focused THEN 1 ELSE 0 END) as focused FROM eye_activity WHERE session_id = ?',
+            (session_id,)
+        )
+        activity_row = cursor.fetchone()
 
-    eye_activity_score = 0
-    if activity_row['total'] > 0:
-        eye_activity_score = activity_row['focused'] / activity_row['total']
+        eye_activity_score = 0
+        if activity_row['total'] > 0:
+            eye_activity_score = activity_row['focused'] / activity_row['total']
 
-    # Update session
-    cursor.execute(
-        'UPDATE sessions SET end_time = ?, duration = ?, eye_activity_score = ? WHERE id = ?',
-        (end_time, duration, eye_activity_score, session_id)
-    )
-    conn.commit()
-    conn.close()
+        # Update session
+        cursor.execute(
+            'UPDATE sessions SET end_time = ?, duration = ?, eye_activity_score = ? WHERE id = ?',
+            (end_time, duration, eye_activity_score, session_id)
+        )
+        conn.commit()
 
     return jsonify({
         'session_id': session_id,
@@ -242,14 +223,13 @@ def log_eye_activity():
 
     timestamp = datetime.now()
 
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute(
-        'INSERT INTO eye_activity (session_id, timestamp, gaze_focused) VALUES (?, ?, ?)',
-        (session_id, timestamp, gaze_focused)
-    )
-    conn.commit()
-    conn.close()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT INTO eye_activity (session_id, timestamp, gaze_focused) VALUES (?, ?, ?)',
+            (session_id, timestamp, gaze_focused)
+        )
+        conn.commit()
 
     return jsonify({
         'status': 'logged',
@@ -260,14 +240,12 @@ def log_eye_activity():
 @app.route('/api/recommend_interval/<session_id>', methods=['GET'])
 def recommend_interval(session_id):
     """Calculate recommended break interval based on adaptive logic"""
-    conn = get_db()
-    cursor = conn.cursor()
-
-    cursor.execute('SELECT eye_activity_score, duration FROM sessions WHERE id = ?', (session_id,))
-    row = cursor.fetchone()
+    with read_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT eye_activity_score, duration FROM sessions WHERE id = ?', (session_id,))
+        row = cursor.fetchone()
 
     if not row:
-        conn.close()
         return jsonify({'error': 'Session not found'}), 404
 
     eye_activity_score = row['eye_activity_score'] or 0.5
@@ -281,8 +259,6 @@ def recommend_interval(session_id):
     else:
         recommended_break = 600  # 10 minutes
 
-    conn.close()
-
     return jsonify({
         'session_id': session_id,
         'recommended_break_seconds': recommended_break,
@@ -384,4 +360,7 @@ if __name__ == '__main__':
     from services.gaze_tracker import GazeTracker  # import inside main
     tracker = GazeTracker()                        # create tracker here
     init_db()
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    try:
+        socketio.run(app, debug=True, host='0.0.0.0', port=5000)
+    finally:
+        storage.close_all()
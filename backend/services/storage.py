@@ -0,0 +1,222 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from urllib.parse import quote
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT = 'default'
+TENANT_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        start_time TIMESTAMP,
+        end_time TIMESTAMP,
+        duration INTEGER,
+        eye_activity_score REAL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS eye_activity (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id TEXT,
+        timestamp TIMESTAMP,
+        gaze_focused BOOLEAN,
+        FOREIGN KEY (session_id) REFERENCES sessions (id)
+    )
+    ''',
+)
+
+
+class InvalidTenantError(ValueError):
+    """Raised when a tenant key cannot be mapped to a shard file"""
+
+
+class UnknownTenantError(LookupError):
+    """Raised when reading from a tenant that has no shard on disk"""
+
+
+class _Shard:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.users = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        # Requests for a tenant are serialized on shard.lock; WAL only lets
+        # readers in other processes (and snapshots) run alongside the writer
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        for statement in SCHEMA:
+            self.conn.execute(statement)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class ShardRouter:
+    """Route each tenant to its own SQLite file.
+
+    Every tenant gets a separate database, so writers for different tenants
+    never contend for the same file lock. Open connections are kept in a
+    bounded LRU; connections currently checked out are never evicted.
+    """
+
+    def __init__(self, default_path, shard_dir, max_open=32):
+        self.default_path = default_path
+        self.shard_dir = shard_dir
+        self.max_open = max_open
+        self._shards = OrderedDict()
+        self._lock = threading.Lock()
+
+    def shard_path(self, tenant):
+        """Return the database file for a tenant key"""
+        if tenant is None or tenant == DEFAULT_TENANT:
+            return self.default_path
+        if not TENANT_PATTERN.match(tenant):
+            raise InvalidTenantError(f'Invalid tenant id: {tenant!r}')
+        return os.path.join(self.shard_dir, f'{tenant}.db')
+
+    def tenants(self):
+        """List every tenant that has a shard on disk"""
+        tenants = [DEFAULT_TENANT] if os.path.exists(self.default_path) else []
+        if os.path.isdir(self.shard_dir):
+            for name in sorted(os.listdir(self.shard_dir)):
+                stem, ext = os.path.splitext(name)
+                if ext == '.db' and TENANT_PATTERN.match(stem) and stem != DEFAULT_TENANT:
+                    tenants.append(stem)
+        return tenants
+
+    @contextmanager
+    def connect(self, tenant=None):
+        """Check out the connection for a tenant's shard.
+
+        The shard is locked for the duration of the block, and any
+        uncommitted changes are rolled back if the block raises.
+        """
+        shard = self._acquire(self.shard_path(tenant))
+        try:
+            with shard.lock:
+                try:
+                    yield shard.conn
+                except BaseException:
+                    shard.conn.rollback()
+                    raise
+        finally:
+            self._release(shard)
+
+    @contextmanager
+    def snapshot(self, tenant=None):
+        """Open a short-lived read-only connection to a tenant's shard.
+
+        Unlike connect(), this never touches the connection pool or the
+        shard lock, so reads run alongside the tenant's writer and never
+        create a shard for an unknown tenant.
+        """
+        path = self.shard_path(tenant)
+        if not os.path.exists(path):
+            raise UnknownTenantError(f'Unknown tenant: {tenant!r}')
+        conn = sqlite3.connect(f'file:{quote(os.path.abspath(path))}?mode=ro', uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def collect(self, func):
+        """Call func on a snapshot of every shard and return the results.
+
+        Shards that cannot be read (still being created, corrupt, or not a
+        shard at all) are logged and skipped.
+        """
+        results = []
+        for tenant in self.tenants():
+            try:
+                with self.snapshot(tenant) as conn:
+                    results.append(func(conn))
+            except (sqlite3.DatabaseError, UnknownTenantError) as error:
+                logger.warning('Skipping shard %r: %s', tenant, error)
+        return results
+
+    def close_all(self):
+        """Close every idle connection"""
+        with self._lock:
+            for path in [p for p, s in self._shards.items() if s.users == 0]:
+                self._shards.pop(path).close()
+
+    def _acquire(self, path):
+        with self._lock:
+            shard = self._shards.get(path)
+            if shard is None:
+                if path != self.default_path:
+                    os.makedirs(self.shard_dir, exist_ok=True)
+                shard = _Shard(path)
+                self._shards[path] = shard
+            else:
+                self._shards.move_to_end(path)
+            shard.users += 1
+            self._evict()
+            return shard
+
+    def _release(self, shard):
+        with self._lock:
+            shard.users -= 1
+            self._evict()
+
+    def _evict(self):
+        # Caller holds self._lock
+        excess = len(self._shards) - self.max_open
+        if excess <= 0:
+            return
+        for path in [p for p, s in self._shards.items() if s.users == 0][:excess]:
+            self._shards.pop(path).close()
+
+
+def shard_stats(conn, today):
+    """Collect additive stats for one shard so they can be merged across shards"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT COUNT(*) AS total_sessions,
+               COALESCE(SUM(duration), 0) AS total_focus_time,
+               COUNT(duration) AS timed_sessions,
+               COALESCE(SUM(eye_activity_score), 0) AS total_focus_score,
+               COUNT(eye_activity_score) AS scored_sessions,
+               MAX(eye_activity_score) AS best_focus_score,
+               COALESCE(SUM(DATE(start_time) = ?), 0) AS today_sessions
+        FROM sessions
+        """,
+        (today,)
+    )
+    return dict(cursor.fetchone())
+
+
+def merge_stats(partials):
+    """Combine per-shard stats into the response shape used by /api/stats"""
+    total_sessions = sum(p['total_sessions'] for p in partials)
+    total_focus_time = sum(p['total_focus_time'] for p in partials)
+    timed_sessions = sum(p['timed_sessions'] for p in partials)
+    scored_sessions = sum(p['scored_sessions'] for p in partials)
+    total_focus_score = sum(p['total_focus_score'] for p in partials)
+    today_sessions = sum(p['today_sessions'] for p in partials)
+    best_scores = [p['best_focus_score'] for p in partials if p['best_focus_score'] is not None]
+
+    avg_session = total_focus_time / timed_sessions if timed_sessions else 0
+    avg_focus_score = total_focus_score / scored_sessions if scored_sessions else 0
+    best_focus_score = max(best_scores) if best_scores else 0
+
+    return {
+        'totalSessions': total_sessions,
+        'totalFocusTime': total_focus_time,
+        'averageSession': round(avg_session / 60, 2),   # minutes
+        'todaySessions': today_sessions,
+        'averageFocusScore': round(avg_focus_score * 100, 2),  # percentage
+        'bestFocusScore': round(best_focus_score * 100, 2)  # percentage
+    }
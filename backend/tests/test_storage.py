@@ -0,0 +1,145 @@
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from services.storage import (SCHEMA, InvalidTenantError, ShardRouter,  # noqa: E402
+                              UnknownTenantError, merge_stats, shard_stats)
+
+
+@pytest.fixture
+def router(tmp_path):
+    return ShardRouter(str(tmp_path / 'pomodoro.db'), str(tmp_path / 'shards'), max_open=1)
+
+
+def open_paths(router):
+    return list(router._shards)
+
+
+def test_checked_out_shard_survives_eviction(router):
+    with router.connect('alpha') as alpha:
+        with router.connect('beta'):
+            pass
+        # alpha is still in use, so beta's acquire must not close it
+        assert alpha.execute('SELECT COUNT(*) FROM sessions').fetchone()[0] == 0
+        assert router.shard_path('alpha') in open_paths(router)
+
+    assert open_paths(router) == [router.shard_path('alpha')]
+
+
+def test_idle_shards_evicted_in_lru_order(tmp_path):
+    router = ShardRouter(str(tmp_path / 'pomodoro.db'), str(tmp_path / 'shards'), max_open=2)
+    for tenant in ('alpha', 'beta', 'alpha', 'gamma'):
+        with router.connect(tenant):
+            pass
+
+    assert open_paths(router) == [router.shard_path('alpha'), router.shard_path('gamma')]
+
+
+def test_rollback_on_exception(router):
+    with pytest.raises(RuntimeError):
+        with router.connect('alpha') as conn:
+            conn.execute("INSERT INTO sessions (id) VALUES ('s1')")
+            raise RuntimeError
+
+    with router.connect('alpha') as conn:
+        assert conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0] == 0
+
+
+@pytest.mark.parametrize('tenant', ['../x', ''])
+def test_invalid_tenant_rejected(router, tenant):
+    with pytest.raises(InvalidTenantError):
+        router.shard_path(tenant)
+
+
+def test_tenants_lists_shards_on_disk(router):
+    for tenant in ('default', 'beta', 'alpha'):
+        with router.connect(tenant):
+            pass
+
+    assert router.tenants() == ['default', 'alpha', 'beta']
+
+
+def test_snapshot_does_not_touch_pool(router):
+    with router.connect('alpha'):
+        pass
+    with router.connect('beta'):
+        pass
+
+    with router.snapshot('alpha') as conn:
+        assert conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0] == 0
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO sessions (id) VALUES ('s1')")
+
+    assert open_paths(router) == [router.shard_path('beta')]
+
+
+def test_snapshot_unknown_tenant_does_not_create_shard(router):
+    with pytest.raises(UnknownTenantError):
+        with router.snapshot('ghost'):
+            pass
+
+    assert not os.path.exists(router.shard_path('ghost'))
+    assert router.tenants() == []
+
+
+def test_collect_skips_unreadable_shards(router):
+    for tenant in ('alpha', 'beta'):
+        with router.connect(tenant) as conn:
+            conn.execute("INSERT INTO sessions (id) VALUES (?)", (tenant,))
+            conn.commit()
+    # A shard file without the schema, e.g. one still being created
+    sqlite3.connect(os.path.join(router.shard_dir, 'junk.db')).close()
+
+    counts = router.collect(lambda conn: conn.execute('SELECT COUNT(*) FROM sessions').fetchone()[0])
+
+    assert router.tenants() == ['alpha', 'beta', 'junk']
+    assert counts == [1, 1]
+
+
+def test_close_all_closes_idle_connections(router):
+    with router.connect('alpha') as conn:
+        pass
+
+    router.close_all()
+
+    assert open_paths(router) == []
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')
+
+
+def test_merge_stats_matches_single_table():
+    now = datetime.now()
+    rows = [
+        ('a1', now, 1500, 0.9),
+        ('a2', now, 900, 0.4),
+        ('b1', now, 600, 0.7),
+        ('b2', now, None, 0),
+    ]
+
+    def make_db(subset):
+        conn = sqlite3.connect(':memory:')
+        conn.row_factory = sqlite3.Row
+        for statement in SCHEMA:
+            conn.execute(statement)
+        conn.executemany(
+            'INSERT INTO sessions (id, start_time, duration, eye_activity_score) VALUES (?, ?, ?, ?)',
+            subset
+        )
+        return conn
+
+    combined = make_db(rows)
+    partials = [shard_stats(make_db(rows[:2]), now.date()), shard_stats(make_db(rows[2:]), now.date())]
+    merged = merge_stats(partials)
+
+    avg_session = combined.execute('SELECT AVG(duration) FROM sessions').fetchone()[0]
+    avg_focus = combined.execute('SELECT AVG(eye_activity_score) FROM sessions').fetchone()[0]
+    best_focus = combined.execute('SELECT MAX(eye_activity_score) FROM sessions').fetchone()[0]
+
+    assert merged['totalSessions'] == 4
+    assert merged['averageSession'] == round(avg_session / 60, 2)
+    assert merged['averageFocusScore'] == round(avg_focus * 100, 2)
+    assert merged['bestFocusScore'] == round(best_focus * 100, 2)